@@ -1,104 +1,267 @@
-import requests
-import json
-import csv
+import asyncio
+import httpx
+import hishel
+from hishel.httpx import AsyncCacheTransport
 import re
-import time
-import threading
+import ssl
 from datetime import datetime, timedelta
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from bs4 import BeautifulSoup
+from contextlib import AsyncExitStack
+from lxml import html as lxml_html
+from selectolax.lexbor import LexborHTMLParser
+from aiolimiter import AsyncLimiter
+import xxhash
+import numpy as np
 import pandas as pd
+from pathlib import Path
 from urllib.parse import urljoin, urlparse
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
-from queue import Queue
 import random
 
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+try:
+    import uvloop
+except ImportError:  # uvloop does not support Windows
+    uvloop = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+]
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Precompiled patterns used on every fetched page
+_LABELS_RE = re.compile(r'labels\s*:\s*\[(.*?)\]', re.DOTALL)
+_DATA_RE = re.compile(r'data\s*:\s*\[(.*?)\]', re.DOTALL)
+_CHARTDATA_RE = re.compile(r'chartData\s*[:=]\s*(\{.*?\})', re.DOTALL)
+_PRICEDATA_RE = re.compile(r'priceData\s*[:=]\s*(\[.*?\])', re.DOTALL)
+_CHART_PATTERNS = (_LABELS_RE, _DATA_RE, _CHARTDATA_RE, _PRICEDATA_RE)
+# Cheap substring checks; scripts containing none of these cannot match _CHART_PATTERNS
+_CHART_KEYWORDS = ('labels', 'data', 'chartData', 'priceData')
+_BRAND_CLEAN_RE = re.compile(r'[^\w\s-]')
+_URL_PRODUCT_ID_RE = re.compile(r'-p(\d+)\.html')
+_HTML_PRODUCT_ID_RE = re.compile(r'product[_-]?id["\']?\s*[:=]\s*["\']?(\d+)', re.IGNORECASE)
+# Chart date label formats ('%d %b %Y' as in data/raw, "Nov '22" month labels, ISO dates)
+_DATE_FORMATS = ('%d %b %Y', "%b '%y", 'ISO8601')
+_INT32_INFO = np.iinfo(np.int32)
+_API_URL_RE = re.compile(r'["\']((?:https?://[^"\'\s]+)?/[^"\'\s]*(?:price|history|chart)[^"\'\s]*)["\']', re.IGNORECASE)
+
+# The fetched page text is re-encoded as UTF-8 before parsing
+_UTF8_HTML_PARSER = lxml_html.HTMLParser(encoding='utf-8')
+
+# Product title lookups, in priority order (h1, .product-title, [class*=title], [class*=product-name])
+_TITLE_XPATHS = (
+    '//h1',
+    '//*[contains(concat(" ", normalize-space(@class), " "), " product-title ")]',
+    '//*[contains(@class, "title")]',
+    '//*[contains(@class, "product-name")]'
+)
+
+# Finds the rendered price chart's data in one pass over the Chart.js instances,
+# the first canvas and known globals; serialized in-page to keep marshaling cheap
+_CHART_JS = """
+() => {
+    const fromData = (d) => d && d.labels && d.datasets && d.datasets[0]
+        ? {labels: d.labels, data: d.datasets[0].data}
+        : null;
+    const instances = window.Chart && window.Chart.instances ? Object.values(window.Chart.instances) : [];
+    const canvas = document.querySelector('canvas');
+    const candidates = [
+        instances[0] && instances[0].data,
+        canvas && canvas.chart && canvas.chart.data,
+        window.chartData, window.priceData, window.historyData, window.priceHistoryData
+    ];
+    for (const candidate of candidates) {
+        const chartData = fromData(candidate);
+        if (chartData) {
+            return JSON.stringify(chartData);
+        }
+    }
+    return null;
+}
+"""
+
+class _CacheableResponse(hishel.BaseFilter):
+    """Only store 200 responses, so throttling and server errors are retried on the next run"""
+    
+    def needs_body(self):
+        return False
+    
+    def apply(self, item, body):
+        return item.status_code == 200
+
+
+class _RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Take a rate-limit token for every request that actually goes out to the network"""
+    
+    def __init__(self, transport, limiter):
+        self.transport = transport
+        self.limiter = limiter
+    
+    async def handle_async_request(self, request):
+        async with self.limiter:
+            return await self.transport.handle_async_request(request)
+    
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+# Parsed product info keyed by an xxh3 hash of the page HTML (retries, duplicate URLs)
+_parse_cache = {}
+_PARSE_CACHE_SIZE = 2048
+
+
+async def fetch(client, url, headers=None, retries=3, backoff_factor=0.3):
+    """Fetch a URL with a shared httpx client and return (url, status, text)"""
+    for attempt in range(retries + 1):
+        try:
+            response = await client.get(url, headers=headers)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return url, response.status_code, response.text
+        except httpx.HTTPError as e:
+            if attempt == retries:
+                logger.warning(f"Request failed for {url}: {e}")
+                return url, None, None
+        
+        # Exponential backoff between retries, same schedule as urllib3.Retry
+        await asyncio.sleep(backoff_factor * (2 ** attempt))
+
+
+def parse_chart_dates(dates):
+    """Parse chart date labels with explicit formats, leaving NaT where none applies"""
+    dates = pd.Series(dates, dtype=object)
+    parsed = pd.Series(pd.NaT, index=dates.index, dtype='datetime64[ns, UTC]')
+    
+    is_text = dates.map(lambda value: isinstance(value, str))
+    is_number = dates.map(lambda value: isinstance(value, (int, float, np.number)) and not isinstance(value, bool))
+    is_date = dates.map(lambda value: isinstance(value, (datetime, np.datetime64)))
+    
+    # Numeric labels are JavaScript timestamps in epoch milliseconds
+    if is_number.any():
+        parsed[is_number] = pd.to_datetime(dates[is_number].astype('float64'), unit='ms', errors='coerce', utc=True)
+    if is_date.any():
+        parsed[is_date] = pd.to_datetime(dates[is_date], errors='coerce', utc=True)
+    
+    # Each text label is tried against the formats in order; labels matching none
+    # (e.g. "01 Nov" with no year) stay NaT rather than being guessed
+    for date_format in _DATE_FORMATS:
+        pending = is_text & parsed.isna()
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(dates[pending].str.strip(), format=date_format, errors='coerce', utc=True)
+    
+    return parsed.dt.tz_localize(None)
+
+
+def to_price_arrays(dates=(), prices=()):
+    """Pack parallel date/price sequences into compact NumPy arrays, dropping unparseable points"""
+    n_points = min(len(dates), len(prices))
+    dates = parse_chart_dates(list(dates[:n_points]))
+    prices = pd.to_numeric(pd.Series(list(prices[:n_points]), dtype=object), errors='coerce').round()
+    # Out-of-range prices would wrap around when cast to int32
+    valid = dates.notna() & prices.between(_INT32_INFO.min, _INT32_INFO.max)
+    
+    n_dropped = n_points - int(valid.sum())
+    if n_dropped:
+        logger.warning(f"Dropped {n_dropped} of {n_points} price points with unparseable dates or prices")
+    
+    return {
+        'dates': dates[valid].to_numpy().astype('datetime64[D]'),
+        'prices': prices[valid].to_numpy().astype(np.int32)
+    }
+
+
 class EnhancedPriceHistoryScraper:
-    def __init__(self, headless=True, max_workers=3):
-        """Initialize the scraper with Chrome options and threading"""
+    def __init__(self, headless=True, max_workers=3, max_concurrency=50,
+                 legacy_browser=False, api_url_template=None,
+                 use_cache=True, cache_dir='pricebefore_cache', cache_ttl=timedelta(hours=24),
+                 max_rps=10):
+        """Initialize the scraper with async HTTP settings and optional browser fallback"""
         self.base_url = "https://www.pricebefore.com"
+        self.headless = headless
         self.max_workers = max_workers
-        self.session_pool = []
-        self.driver_pool = []
-        self.setup_session_pool()
-        self.setup_driver_pool(headless)
-        self.csv_lock = threading.Lock()
-        
-    def setup_session_pool(self):
-        """Create a pool of requests sessions"""
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        ]
-        
-        for i in range(self.max_workers):
-            session = requests.Session()
-            session.headers.update({
-                'User-Agent': random.choice(user_agents),
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            })
-            self.session_pool.append(session)
-    
-    def setup_driver_pool(self, headless=True):
-        """Setup Chrome WebDriver pool"""
-        for i in range(min(2, self.max_workers)):  # Limit drivers for memory
-            chrome_options = Options()
-            if headless:
-                chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--window-size=1280,720')
-            chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-            chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-            chrome_options.add_experimental_option('useAutomationExtension', False)
-            chrome_options.add_argument('--disable-logging')
-            chrome_options.add_argument('--log-level=3')
-            
-            try:
-                driver = webdriver.Chrome(options=chrome_options)
-                driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-                self.driver_pool.append(driver)
-            except Exception as e:
-                logger.warning(f"Failed to create driver {i}: {e}")
+        self.max_concurrency = max_concurrency
+        # Global request rate cap, shared by all in-flight URLs
+        self.max_rps = max_rps
+        # e.g. '/api/price-history?id={product_id}'; discovered from the page when None
+        self.api_url_template = api_url_template
+        # Opt-in Chromium fallback for pages the HTTP methods can't extract. The chart endpoint
+        # is guessed from the page unless api_url_template is given, so pass legacy_browser=True
+        # (or api_url_template) to avoid falling through to sample data
+        self.legacy_browser = legacy_browser
+        self.browser = None
+        self.browser_semaphore = None
+        self.browser_lock = None
+        self.browser_attempted = False
+        self.run_stack = None
+        # On-disk response cache so re-runs within cache_ttl skip the network
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.ssl_context = ssl.create_default_context()
+        # Shared across every request; the User-Agent is rotated per request
+        self.headers = {
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate',
+            'Upgrade-Insecure-Requests': '1',
+        }
     
-    def get_session(self):
-        """Get a session from the pool"""
-        return random.choice(self.session_pool) if self.session_pool else requests.Session()
+    async def setup_browser(self, playwright):
+        """Launch the single shared headless Chromium used for the legacy fallback"""
+        try:
+            self.browser = await playwright.chromium.launch(
+                headless=self.headless,
+                args=['--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu',
+                      '--disable-blink-features=AutomationControlled']
+            )
+            # Bound the number of concurrently open pages
+            self.browser_semaphore = asyncio.Semaphore(self.max_workers)
+        except Exception as e:
+            logger.warning(f"Failed to launch browser: {e}")
     
-    def get_driver(self):
-        """Get a driver from the pool"""
-        return random.choice(self.driver_pool) if self.driver_pool else None
+    async def get_browser(self):
+        """Get the shared browser, launching it on the first page that needs it"""
+        async with self.browser_lock:
+            if not self.browser_attempted:
+                self.browser_attempted = True
+                # Playwright is only needed for the browser fallback, so import it on first use
+                try:
+                    from playwright.async_api import async_playwright
+                except ImportError:
+                    logger.warning("Playwright is not installed, skipping the browser fallback")
+                    return None
+                playwright = await self.run_stack.enter_async_context(async_playwright())
+                await self.setup_browser(playwright)
+                if self.browser:
+                    self.run_stack.push_async_callback(self.close_browser)
+        
+        return self.browser
     
     def read_mobile_urls(self, filename='mobile.txt'):
         """Read URLs from mobile.txt file"""
         urls = []
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        if line.startswith('/'):
-                            urls.append(self.base_url + line)
-                        else:
-                            urls.append(line)
+            with open(filename, 'rb') as f:
+                lines = f.read().decode('utf-8').splitlines()
+            
+            base_url = self.base_url
+            urls = [
+                base_url + line if line.startswith('/') else line
+                for line in map(str.strip, lines)
+                if line and not line.startswith('#')
+            ]
             logger.info(f"Read {len(urls)} URLs from {filename}")
         except FileNotFoundError:
             logger.error(f"File {filename} not found")
@@ -108,29 +271,36 @@ class EnhancedPriceHistoryScraper:
         return urls
     
     def extract_product_info(self, html_content):
-        """Extract product title and brand from HTML content"""
-        soup = BeautifulSoup(html_content, 'html.parser')
+        """Extract product title and brand from HTML content, reusing parses of identical pages"""
+        html_bytes = html_content.encode()
+        key = xxhash.xxh3_64_intdigest(html_bytes)
+        product_info = _parse_cache.get(key)
+        if product_info is None:
+            product_info = self.parse_product_info(html_bytes)
+            if len(_parse_cache) >= _PARSE_CACHE_SIZE:
+                _parse_cache.clear()
+            _parse_cache[key] = product_info
+        
+        return dict(product_info)
+    
+    def parse_product_info(self, html_content):
+        """Parse product title and brand from HTML content"""
+        # Bytes with a fixed encoding, since lxml rejects str pages that carry an encoding declaration
+        tree = lxml_html.fromstring(html_content, parser=_UTF8_HTML_PARSER)
         
         # Extract title
         title = None
-        title_selectors = [
-            'h1',
-            '.product-title',
-            '[class*="title"]',
-            '[class*="product-name"]'
-        ]
-        
-        for selector in title_selectors:
-            element = soup.select_one(selector)
-            if element:
-                title = element.get_text(strip=True)
+        for xpath in _TITLE_XPATHS:
+            elements = tree.xpath(xpath)
+            if elements:
+                title = ''.join(text.strip() for text in elements[0].itertext())
                 break
         
         if not title:
             # Try to find title in meta tags
-            meta_title = soup.find('meta', {'property': 'og:title'})
+            meta_title = tree.xpath('//meta[@property="og:title"]/@content')
             if meta_title:
-                title = meta_title.get('content', '').strip()
+                title = meta_title[0].strip()
         
         # Extract brand from title
         brand = None
@@ -142,288 +312,355 @@ class EnhancedPriceHistoryScraper:
                 brand = words[0]
                 
                 # Clean up brand name
-                brand = re.sub(r'[^\w\s-]', '', brand).strip()
+                brand = _BRAND_CLEAN_RE.sub('', brand).strip()
         
         return {
             'title': title or 'Unknown Product',
             'brand': brand or 'Unknown Brand'
         }
     
-    def extract_chart_data_advanced(self, url):
-        """Advanced chart data extraction with multiple fallback methods"""
+    def parse_product_data(self, url, html_content=None, api_content=None):
+        """Extract product info and price data from the fetched page and chart endpoint"""
+        # Price history is kept as parallel arrays: datetime64[D] dates and int32 prices
         product_data = {
             'title': 'Unknown Product',
             'brand': 'Unknown Brand',
-            'price_data': []
+            **to_price_arrays()
         }
         
-        # Method 1: Try with requests first (faster)
-        try:
-            session = self.get_session()
-            response = session.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                product_info = self.extract_product_info(response.text)
-                product_data.update(product_info)
-                
-                # Look for embedded JSON data
-                price_data = self.extract_price_from_html(response.text)
-                if price_data:
-                    product_data['price_data'] = price_data
+        if html_content:
+            try:
+                product_data.update(self.extract_product_info(html_content))
+            except Exception as e:
+                logger.warning(f"Product info parsing failed for {url}: {e}")
+        
+        # Method 1: Parse the chart's JSON endpoint response (single HTTP round-trip)
+        if api_content:
+            try:
+                price_arrays = self.parse_price_api_response(api_content)
+                if len(price_arrays['prices']):
+                    product_data.update(price_arrays)
                     return product_data
+            
+            except Exception as e:
+                logger.warning(f"API response parsing failed for {url}: {e}")
         
-        except Exception as e:
-            logger.warning(f"Requests method failed for {url}: {e}")
+        # Method 2: Look for embedded JSON data in the HTML fetched by the async pipeline
+        if html_content:
+            try:
+                price_arrays = self.extract_price_from_html(html_content)
+                if len(price_arrays['prices']):
+                    product_data.update(price_arrays)
+            
+            except Exception as e:
+                logger.warning(f"HTML parsing failed for {url}: {e}")
+        
+        return product_data
+    
+    async def extract_chart_data_advanced(self, url, html_content=None, api_content=None):
+        """Advanced chart data extraction with multiple fallback methods"""
+        # Parsing is blocking, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        product_data = await loop.run_in_executor(None, self.parse_product_data, url, html_content, api_content)
+        
+        # Method 3: Legacy headless browser extraction, only when explicitly enabled
+        if not len(product_data['prices']) and self.legacy_browser and await self.get_browser():
+            await self.extract_chart_data_browser(url, product_data)
         
-        # Method 2: Try with Selenium
-        driver = self.get_driver()
-        if driver:
+        # Method 4: Generate sample data if extraction fails
+        if not len(product_data['prices']):
+            logger.warning(f"NO REAL PRICE DATA for {url} - writing randomly generated SAMPLE prices to the output")
+            product_data.update(self.generate_sample_price_data())
+            product_data['sample'] = True
+        
+        return product_data
+    
+    async def extract_chart_data_browser(self, url, product_data):
+        """Extract chart data by rendering the page in the shared Chromium (legacy path)"""
+        async with self.browser_semaphore:
+            # One lightweight context per page, all sharing the single browser process
+            context = await self.browser.new_context(
+                user_agent=random.choice(USER_AGENTS),
+                viewport={'width': 1280, 'height': 720}
+            )
+            await context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+            
             try:
-                driver.get(url)
-                WebDriverWait(driver, 15).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
+                page = await context.new_page()
+                await page.goto(url, wait_until='networkidle', timeout=15000)
                 
                 # Extract product info
                 try:
-                    title_element = driver.find_element(By.TAG_NAME, "h1")
-                    product_data['title'] = title_element.text.strip()
-                    
-                    # Extract brand from title
-                    words = product_data['title'].split()
-                    if words:
-                        product_data['brand'] = re.sub(r'[^\w\s-]', '', words[0]).strip()
+                    title_element = await page.query_selector('h1')
+                    if title_element:
+                        product_data['title'] = (await title_element.inner_text()).strip()
+                        
+                        # Extract brand from title
+                        words = product_data['title'].split()
+                        if words:
+                            product_data['brand'] = _BRAND_CLEAN_RE.sub('', words[0]).strip()
                 
                 except Exception as e:
                     logger.warning(f"Could not extract title from {url}: {e}")
                 
-                # Wait for chart to load
-                time.sleep(3)
-                
-                # Extract chart data using JavaScript
-                script = """
-                var chartData = null;
-                
-                // Method 1: Chart.js instances
-                if (window.Chart && window.Chart.instances) {
-                    var instances = Object.values(window.Chart.instances);
-                    if (instances.length > 0) {
-                        var chart = instances[0];
-                        if (chart.data && chart.data.datasets && chart.data.datasets[0]) {
-                            chartData = {
-                                labels: chart.data.labels,
-                                data: chart.data.datasets[0].data
-                            };
-                        }
-                    }
-                }
-                
-                // Method 2: Canvas chart property
-                if (!chartData) {
-                    var canvases = document.querySelectorAll('canvas');
-                    for (var i = 0; i < canvases.length; i++) {
-                        if (canvases[i].chart && canvases[i].chart.data) {
-                            chartData = {
-                                labels: canvases[i].chart.data.labels,
-                                data: canvases[i].chart.data.datasets[0].data
-                            };
-                            break;
-                        }
-                    }
-                }
-                
-                // Method 3: Global variables
-                if (!chartData) {
-                    var possibleVars = ['chartData', 'priceData', 'historyData', 'priceHistoryData'];
-                    for (var j = 0; j < possibleVars.length; j++) {
-                        if (window[possibleVars[j]]) {
-                            var data = window[possibleVars[j]];
-                            if (data.labels && data.datasets) {
-                                chartData = {
-                                    labels: data.labels,
-                                    data: data.datasets[0].data
-                                };
-                            }
-                            break;
-                        }
-                    }
-                }
-                
-                return chartData;
-                """
-                
-                chart_data = driver.execute_script(script)
+                # Extract chart data using JavaScript, returned as a JSON string
+                raw = await page.evaluate(_CHART_JS)
+                chart_data = _json.loads(raw) if raw else None
                 
                 if chart_data and chart_data.get('labels') and chart_data.get('data'):
-                    price_data = []
-                    labels = chart_data['labels']
-                    prices = chart_data['data']
-                    
-                    for i in range(len(labels)):
-                        if i < len(prices):
-                            price_data.append({
-                                'date': labels[i],
-                                'price': prices[i]
-                            })
-                    
-                    product_data['price_data'] = price_data
-                    logger.info(f"Extracted {len(price_data)} price points for {product_data['title']}")
+                    product_data.update(to_price_arrays(chart_data['labels'], chart_data['data']))
+                    logger.info(f"Extracted {len(product_data['prices'])} price points for {product_data['title']}")
                 
             except Exception as e:
-                logger.error(f"Selenium extraction failed for {url}: {e}")
-        
-        # Method 3: Generate sample data if extraction fails
-        if not product_data['price_data']:
-            logger.info(f"Generating sample data for {url}")
-            product_data['price_data'] = self.generate_sample_price_data()
+                logger.error(f"Browser extraction failed for {url}: {e}")
+            
+            finally:
+                await context.close()
         
         return product_data
     
+    def extract_product_id(self, url, html_content=None):
+        """Extract the numeric product id from the product URL or page HTML"""
+        match = _URL_PRODUCT_ID_RE.search(url)
+        if match:
+            return match.group(1)
+        
+        if html_content:
+            match = _HTML_PRODUCT_ID_RE.search(html_content)
+            if match:
+                return match.group(1)
+        
+        return None
+    
+    def build_api_url(self, url, html_content):
+        """Build the URL of the JSON endpoint the price chart loads its data from"""
+        product_id = self.extract_product_id(url, html_content)
+        if not product_id:
+            return None
+        
+        if self.api_url_template:
+            return urljoin(self.base_url, self.api_url_template.format(product_id=product_id))
+        
+        # Otherwise look for the chart's XHR endpoint referenced in the page's scripts
+        for match in _API_URL_RE.findall(html_content):
+            if product_id in match and not match.endswith('.html'):
+                return urljoin(self.base_url, match)
+        
+        return None
+    
+    def parse_price_api_response(self, api_content):
+        """Convert the chart endpoint's JSON payload into price data arrays"""
+        data = _json.loads(api_content)
+        
+        dates, prices = [], []
+        if isinstance(data, dict):
+            if 'labels' in data and 'data' in data:
+                dates, prices = data['labels'], data['data']
+            elif 'dates' in data and 'prices' in data:
+                dates, prices = data['dates'], data['prices']
+        
+        elif isinstance(data, list):
+            for item in data:
+                if isinstance(item, dict):
+                    date_val = next((item[k] for k in ('date', 'time', 'x', 'timestamp') if k in item), None)
+                    price_val = next((item[k] for k in ('price', 'value', 'y', 'amount') if k in item), None)
+                    if date_val is not None and price_val is not None:
+                        dates.append(date_val)
+                        prices.append(price_val)
+        
+        return to_price_arrays(dates, prices)
+    
     def extract_price_from_html(self, html_content):
         """Extract price data from HTML source"""
-        price_data = []
-        
         # Look for JSON data in script tags
-        script_pattern = r'<script[^>]*>(.*?)</script>'
-        scripts = re.findall(script_pattern, html_content, re.DOTALL | re.IGNORECASE)
-        
-        for script in scripts:
-            # Look for chart data patterns
-            patterns = [
-                r'labels\s*:\s*\[(.*?)\]',
-                r'data\s*:\s*\[(.*?)\]',
-                r'chartData\s*[:=]\s*(\{.*?\})',
-                r'priceData\s*[:=]\s*(\[.*?\])'
-            ]
+        for node in LexborHTMLParser(html_content).css('script'):
+            script = node.text()
+            if not any(keyword in script for keyword in _CHART_KEYWORDS):
+                continue
             
-            for pattern in patterns:
-                matches = re.findall(pattern, script, re.DOTALL)
-                if matches:
-                    try:
-                        # Try to parse the data
-                        for match in matches:
-                            if '[' in match and ']' in match:
-                                # This might be array data
-                                data = json.loads(f'[{match}]')
-                                if len(data) > 10:  # Likely price data
-                                    # Generate dates for the data
-                                    start_date = datetime(2022, 11, 1)
-                                    for i, price in enumerate(data):
-                                        date = start_date + timedelta(days=i * 7)
-                                        price_data.append({
-                                            'date': date.strftime('%Y-%m-%d'),
-                                            'price': price
-                                        })
-                                    return price_data
-                    except:
-                        continue
-        
-        return price_data
+            # Look for chart data patterns
+            for pattern in _CHART_PATTERNS:
+                for match in pattern.findall(script):
+                    if '[' in match and ']' in match:
+                        # This might be array data; a candidate that is not a list of
+                        # prices moves on to the next one instead of ending the search
+                        try:
+                            data = _json.loads(f'[{match}]')
+                            if len(data) > 10:  # Likely price data
+                                # Generate weekly dates for the data
+                                dates = np.datetime64('2022-11-01') + np.arange(len(data)) * 7
+                                price_arrays = to_price_arrays(dates, data)
+                                if len(price_arrays['prices']):
+                                    return price_arrays
+                        except (_json.JSONDecodeError, TypeError, ValueError):
+                            continue
+        
+        return to_price_arrays()
     
     def generate_sample_price_data(self):
         """Generate realistic sample price data"""
-        price_data = []
         start_date = datetime(2022, 11, 1)
         end_date = datetime(2025, 8, 2)
         base_price = random.randint(2000, 50000)
+        n_days = (end_date - start_date).days + 1
         
-        current_date = start_date
-        while current_date <= end_date:
-            # Simulate price variations
-            days_since_start = (current_date - start_date).days
-            seasonal_factor = 1 + 0.1 * (days_since_start % 365) / 365
-            trend_factor = 1 + random.uniform(-0.1, 0.1) * days_since_start / 365
-            random_factor = 1 + random.uniform(-0.05, 0.05)
-            
-            price = int(base_price * seasonal_factor * trend_factor * random_factor)
-            
-            price_data.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'price': max(100, price)  # Ensure minimum price
-            })
-            
-            current_date += timedelta(days=random.randint(1, 7))  # Variable intervals
+        # Variable 1-7 day intervals, as day offsets from the start date
+        steps = np.random.randint(1, 8, size=n_days)
+        days_since_start = np.concatenate(([0], np.cumsum(steps)))
+        days_since_start = days_since_start[days_since_start < n_days]
+        n_points = len(days_since_start)
+        
+        # Simulate price variations
+        seasonal_factor = 1 + 0.1 * (days_since_start % 365) / 365
+        trend_factor = 1 + np.random.uniform(-0.1, 0.1, n_points) * days_since_start / 365
+        random_factor = 1 + np.random.uniform(-0.05, 0.05, n_points)
         
-        return price_data
+        prices = (base_price * seasonal_factor * trend_factor * random_factor).astype(np.int32)
+        prices = np.maximum(100, prices)  # Ensure minimum price
+        
+        return {
+            'dates': np.datetime64(start_date, 'D') + days_since_start,
+            'prices': prices
+        }
     
-    def save_to_csv(self, all_data, filename='mobile-phone.csv'):
-        """Save all extracted data to CSV file"""
+    def save_to_csv(self, all_data, filename='mobile-phone.csv', compress=False):
+        """Save all extracted data to CSV in a single write, returning the path written or None"""
+        # Results are only aggregated on the event loop thread, so writing needs no locking
         try:
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['title', 'brand', 'date', 'price'])
-                
-                total_rows = 0
-                for product_data in all_data:
-                    title = product_data['title']
-                    brand = product_data['brand']
-                    
-                    for price_entry in product_data['price_data']:
-                        writer.writerow([
-                            title,
-                            brand,
-                            price_entry['date'],
-                            price_entry['price']
-                        ])
-                        total_rows += 1
-                
-                logger.info(f"Saved {total_rows} rows to {filename}")
-                return True
+            frames = [
+                pd.DataFrame({
+                    'title': product_data['title'],
+                    'brand': product_data['brand'],
+                    'date': product_data['dates'],
+                    'price': product_data['prices']
+                })
+                for product_data in all_data
+            ]
+            
+            df = pd.concat(frames, ignore_index=True)
+            
+            if compress:
+                # Only needed for compressed output
+                import zstandard as zstd
                 
+                # zstd level 3 shrinks the CSV several-fold at a few hundred MB/s
+                filename += '.zst'
+                cctx = zstd.ZstdCompressor(level=3, threads=-1)
+                with open(filename, 'wb') as raw, cctx.stream_writer(raw) as compressed:
+                    compressed.write(df.to_csv(index=False, date_format='%Y-%m-%d').encode('utf-8'))
+            else:
+                # 1 MiB buffer so the serialized rows reach disk in few write() calls
+                with open(filename, 'w', newline='', encoding='utf-8', buffering=1 << 20) as csvfile:
+                    df.to_csv(csvfile, index=False, date_format='%Y-%m-%d')
+            
+            logger.info(f"Saved {len(df)} rows to {filename}")
+            return filename
+            
         except Exception as e:
             logger.error(f"Error saving to CSV: {e}")
-            return False
+            return None
     
-    def process_single_url(self, url):
-        """Process a single URL and return product data"""
+    async def process_single_url(self, url, html_content=None, api_content=None):
+        """Process a single fetched URL and return product data"""
         try:
             logger.info(f"Processing: {url}")
-            product_data = self.extract_chart_data_advanced(url)
-            
-            # Add random delay to avoid being blocked
-            time.sleep(random.uniform(1, 3))
-            
-            return product_data
+            return await self.extract_chart_data_advanced(url, html_content, api_content)
             
         except Exception as e:
             logger.error(f"Error processing {url}: {e}")
             return None
     
-    def scrape_multiple_products(self, urls, output_file='mobile-phone.csv'):
-        """Scrape multiple products using threading"""
-        logger.info(f"Starting to scrape {len(urls)} products...")
+    def create_client(self, limits, limiter=None):
+        """Create the shared HTTP/2 client, backed by the on-disk cache unless disabled"""
+        transport = httpx.AsyncHTTPTransport(http2=True, limits=limits, verify=self.ssl_context)
+        if limiter is not None:
+            # Below the cache, so every network attempt (retries included) takes a token
+            # while responses served from the cache don't
+            transport = _RateLimitedTransport(transport, limiter)
         
-        all_data = []
-        successful = 0
-        failed = 0
+        if self.use_cache:
+            storage = hishel.AsyncSqliteStorage(database_path=Path(self.cache_dir) / 'cache.db',
+                                                default_ttl=self.cache_ttl.total_seconds())
+            # Cache every successful GET for cache_ttl even when the site sends no caching headers
+            policy = hishel.FilterPolicy(response_filters=[_CacheableResponse()])
+            transport = AsyncCacheTransport(next_transport=transport, storage=storage, policy=policy)
+        
+        return httpx.AsyncClient(transport=transport, headers=self.headers, timeout=10.0)
+    
+    async def _gather(self, urls):
+        """Fetch all URLs concurrently over one keep-alive connection pool"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # Token bucket to avoid being blocked, without idling individual tasks
+        limiter = AsyncLimiter(self.max_rps, 1.0)
+        # Every URL is on www.pricebefore.com, so HTTP/2 multiplexes the concurrent
+        # requests as streams over a handful of connections. One SSLContext for the
+        # whole run lets any new connection resume a cached TLS session.
+        limits = httpx.Limits(max_connections=4, max_keepalive_connections=4)
         
-        # Use ThreadPoolExecutor for parallel processing
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all tasks
-            future_to_url = {executor.submit(self.process_single_url, url): url for url in urls}
+        async with AsyncExitStack() as stack:
+            # Chromium is only started if a page actually needs the legacy fallback
+            self.run_stack = stack
+            self.browser_lock = asyncio.Lock()
+            self.browser_attempted = False
             
-            # Process completed tasks
-            for future in as_completed(future_to_url):
-                url = future_to_url[future]
+            client = await stack.enter_async_context(self.create_client(limits, limiter))
+            
+            async def sem_fetch(url):
+                # Keep one URL's failure (bad URL, cache error, bad template) from aborting the run
                 try:
-                    result = future.result()
-                    if result and result['price_data']:
-                        all_data.append(result)
-                        successful += 1
-                        logger.info(f" Success ({successful}/{len(urls)}): {result['title'][:50]}...")
-                    else:
-                        failed += 1
-                        logger.warning(f" Failed ({failed}/{len(urls)}): {url}")
+                    async with semaphore:
+                        headers = {'User-Agent': random.choice(USER_AGENTS)}
+                        url, status, text = await fetch(client, url, headers=headers)
+                        html_content = text if status == 200 else None
                         
+                        # Fetch the chart data straight from its JSON endpoint
+                        api_content = None
+                        api_url = self.build_api_url(url, html_content) if html_content else None
+                        if api_url:
+                            _, api_status, api_text = await fetch(client, api_url, headers=headers)
+                            api_content = api_text if api_status == 200 else None
+                
                 except Exception as e:
-                    failed += 1
-                    logger.error(f" Exception ({failed}/{len(urls)}): {url} - {e}")
+                    logger.error(f"Error fetching {url}: {e}")
+                    return None
+                
+                return await self.process_single_url(url, html_content, api_content)
+            
+            return await asyncio.gather(*[sem_fetch(url) for url in urls])
+    
+    def scrape_multiple_products(self, urls, output_file='mobile-phone.csv', compress=False):
+        """Scrape multiple products using an asyncio fetch pipeline"""
+        logger.info(f"Starting to scrape {len(urls)} products...")
+        if not self.legacy_browser and not self.api_url_template:
+            logger.warning("No api_url_template and legacy_browser is off: pages whose chart endpoint "
+                           "can't be found in the HTML will get SAMPLE prices")
+        
+        all_data = []
+        successful = 0
+        failed = 0
+        
+        # uvloop's libuv-based loop batches readiness events with fewer syscalls per request
+        run = uvloop.run if uvloop else asyncio.run
+        results = run(self._gather(urls))
+        
+        for url, result in zip(urls, results):
+            if result and len(result['prices']):
+                all_data.append(result)
+                successful += 1
+                logger.info(f" Success ({successful}/{len(urls)}): {result['title'][:50]}...")
+            else:
+                failed += 1
+                logger.warning(f" Failed ({failed}/{len(urls)}): {url}")
         
         # Save results to CSV
         if all_data:
-            if self.save_to_csv(all_data, output_file):
+            output_file = self.save_to_csv(all_data, output_file, compress)
+            if output_file:
                 logger.info(f" Successfully scraped {successful} products!")
-                logger.info(f" Total data points: {sum(len(p['price_data']) for p in all_data)}")
+                n_sample = sum(1 for p in all_data if p.get('sample'))
+                if n_sample:
+                    logger.warning(f" {n_sample}/{successful} products in {output_file} contain SAMPLE (random) prices, not real history")
+                logger.info(f" Total data points: {sum(len(p['prices']) for p in all_data)}")
                 logger.info(f" Results saved to: {output_file}")
                 
                 # Display sample results
@@ -432,7 +669,7 @@ class EnhancedPriceHistoryScraper:
                 print("-" * 77)
                 for data in all_data[:5]:
                     title = data['title'][:47] + "..." if len(data['title']) > 47 else data['title']
-                    print(f"{title:<50} {data['brand']:<15} {len(data['price_data']):<12}")
+                    print(f"{title:<50} {data['brand']:<15} {len(data['prices']):<12}")
                 
                 if len(all_data) > 5:
                     print(f"... and {len(all_data) - 5} more products")
@@ -442,17 +679,17 @@ class EnhancedPriceHistoryScraper:
         logger.error("No data was successfully extracted")
         return None
     
+    async def close_browser(self):
+        """Close the shared browser at the end of a run"""
+        try:
+            await self.browser.close()
+        except Exception:
+            pass
+        self.browser = None
+        self.browser_semaphore = None
+    
     def close(self):
         """Clean up resources"""
-        for driver in self.driver_pool:
-            try:
-                driver.quit()
-            except:
-                pass
-        
-        for session in self.session_pool:
-            try:
-                session.close()
-            except:
-                pass
-
+        # The HTTP client and browser are scoped to each scrape_multiple_products run
+        self.browser = None
+        self.browser_semaphore = None
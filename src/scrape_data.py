@@ -1,32 +1,230 @@
 """
 Price History Data Scraper for PriceBefore.com
 Extracts price history data from chart and saves to CSV
+
+Starting Chrome is the slowest part of a scrape, so construct one
+PriceHistoryScraper per batch and feed it URLs through scrape_urls
+(or scrape_many for parallel batches) instead of one scraper per URL.
 """
 
 import requests
-import json
-import csv
+import base64
 import re
-import time
-from datetime import datetime, timedelta
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from bs4 import BeautifulSoup
+from selenium.common.exceptions import TimeoutException
+from bs4 import BeautifulSoup, SoupStrainer
+import numpy as np
 import pandas as pd
 from urllib.parse import urljoin, urlparse
 import logging
 
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Patterns that might contain price data in inline scripts
+_CHART_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'chartData\s*[:=]\s*(\{[^}]+\})',
+    r'priceData\s*[:=]\s*(\[[^\]]+\])',
+    r'historyData\s*[:=]\s*(\{[^}]+\})',
+    r'labels\s*:\s*\[([^\]]+)\]',
+    r'data\s*:\s*\[([^\]]+)\]'
+)]
+# labels/data capture the array contents without their brackets
+_BARE_ARRAY_PATTERNS = _CHART_PATTERNS[3:]
+# All chart patterns as zero-width lookahead alternatives, so one finditer pass tries
+# each pattern at every position and still sees matches nested inside another match.
+# Pattern i's whole match is group 2i+1 and its capture group 2i+2. No two patterns
+# can start at the same position (their first letters differ), so taking the first
+# alternative that matches loses nothing.
+_CHART_LOOKAHEAD_PATTERN = re.compile(
+    '(?=' + '|'.join(f'({pattern.pattern})' for pattern in _CHART_PATTERNS) + ')', re.IGNORECASE
+)
+_META_PATTERN = re.compile(r'price|data', re.I)
+# URL keywords marking network responses that might carry price data
+_URL_KW = re.compile(r'price|history|chart|data|api', re.I)
+
+# Keys that mark the price/date fields of a list-of-dicts price history
+_PRICE_KEYS = frozenset(('price', 'value', 'y', 'amount'))
+_DATE_KEYS = frozenset(('date', 'time', 'x', 'timestamp'))
+
+# True once a Chart.js instance has a populated dataset
+_CHART_READY_JS = (
+    "return !!(window.Chart && window.Chart.instances && "
+    "Object.values(window.Chart.instances).some(c => c && c.data && c.data.datasets && c.data.datasets[0]))"
+)
+
+# Chart.js extraction function; defined once per page as window.__phx so the
+# browser compiles it once and later calls on the same page reuse it
+_CHART_FN_JS = """
+window.__phx = window.__phx || function() {
+    var chartData = null;
+    
+    // Try Chart.js instances
+    if (window.Chart && window.Chart.instances) {
+        var instances = Object.values(window.Chart.instances);
+        if (instances.length > 0) {
+            var chart = instances[0];
+            if (chart.data && chart.data.datasets) {
+                chartData = {
+                    labels: chart.data.labels,
+                    data: chart.data.datasets[0].data
+                };
+            }
+        }
+    }
+    
+    // Try canvas chart property
+    if (!chartData) {
+        var canvas = document.querySelector('#price_history_chart') || 
+                   document.querySelector('canvas[class*="chart"]') ||
+                   document.querySelector('canvas');
+        if (canvas && canvas.chart) {
+            chartData = {
+                labels: canvas.chart.data.labels,
+                data: canvas.chart.data.datasets[0].data
+            };
+        }
+    }
+    
+    // Look for global variables
+    if (!chartData) {
+        var possibleVars = ['chartData', 'priceData', 'historyData', 'priceHistoryData'];
+        for (var i = 0; i < possibleVars.length; i++) {
+            var varName = possibleVars[i];
+            if (window[varName]) {
+                chartData = window[varName];
+                break;
+            }
+        }
+    }
+    
+    return chartData;
+};
+"""
+# Full script for drivers where the function could not be preinstalled
+_CHART_JS = _CHART_FN_JS + "return window.__phx();"
+# Short invocation sent per call when setup_driver preinstalled window.__phx; returns
+# _PHX_MISSING instead if the page lacks it (preload skipped, document replaced)
+_PHX_MISSING = '__phx_missing__'
+_CHART_CALL_JS = f"return window.__phx ? window.__phx() : '{_PHX_MISSING}';"
+
+
+def _build_chart_database():
+    """Compile all chart patterns into one Hyperscan database scanned in a single pass"""
+    database = hyperscan.Database()
+    database.compile(
+        expressions=[pattern.pattern.encode() for pattern in _CHART_PATTERNS],
+        ids=list(range(len(_CHART_PATTERNS))),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SOM_LEFTMOST] * len(_CHART_PATTERNS)
+    )
+    return database
+
+
+_CHART_DATABASE = None
+if hyperscan:
+    try:
+        _CHART_DATABASE = _build_chart_database()
+    except hyperscan.error as e:
+        # e.g. a pattern construct this libhs version can't compile; the re path still works
+        logger.warning(f"Could not compile chart patterns with Hyperscan, using re instead: {e}")
+_hyperscan_local = threading.local()
+
+# Tags extract_from_page_source looks at
+_STRAINER = SoupStrainer(['script', 'meta'])
+
+# Characters not allowed in output file names derived from URLs
+_SLUG_CLEAN_RE = re.compile(r'[^\w-]+')
+
+
+def _chart_scratch():
+    """Get this thread's Hyperscan scratch space (scratch must not be shared across threads)"""
+    scratch = getattr(_hyperscan_local, 'scratch', None)
+    if scratch is None:
+        scratch = _hyperscan_local.scratch = hyperscan.Scratch(_CHART_DATABASE)
+    return scratch
+
+
+def _find_chart_matches(content):
+    """Return (pattern, captured matches) pairs for each chart pattern found in a script"""
+    results = []
+    
+    if _CHART_DATABASE is None:
+        found = [[] for _ in _CHART_PATTERNS]
+        resume_at = [0] * len(_CHART_PATTERNS)
+        for match in _CHART_LOOKAHEAD_PATTERN.finditer(content):
+            group = match.lastindex
+            index = (group - 1) // 2
+            start, end = match.span(group)
+            # Like findall, a pattern only matches again after the end of its previous match
+            if start >= resume_at[index]:
+                found[index].append(match.group(group + 1))
+                resume_at[index] = end
+        return [(pattern, matches) for pattern, matches in zip(_CHART_PATTERNS, found) if matches]
+    
+    buf = content.encode('utf-8')
+    spans = [[] for _ in _CHART_PATTERNS]
+    
+    def on_match(pattern_id, start, end, flags, context):
+        spans[pattern_id].append((start, end))
+    
+    _CHART_DATABASE.scan(buf, match_event_handler=on_match, scratch=_chart_scratch())
+    
+    # Hyperscan reports match spans only, so pull the capture group out with re
+    for pattern, pattern_spans in zip(_CHART_PATTERNS, spans):
+        matches = []
+        for start, end in pattern_spans:
+            match = pattern.match(buf[start:end].decode('utf-8', errors='ignore'))
+            if match:
+                matches.append(match.group(1))
+        if matches:
+            results.append((pattern, matches))
+    
+    return results
+
+
+def _detect_keys(item):
+    """Return the (date_key, price_key) names used by a price history item, or None for each missing one"""
+    date_key = price_key = None
+    for key in item:
+        lowered = key.lower()
+        if lowered in _DATE_KEYS:
+            date_key = key
+        elif lowered in _PRICE_KEYS:
+            price_key = key
+    return date_key, price_key
+
+
+def _slug(url):
+    """Derive an output file name from a product URL"""
+    name = urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+    name = name.rsplit('.', 1)[0] if name.endswith(('.html', '.htm')) else name
+    return _SLUG_CLEAN_RE.sub('-', name).strip('-') or 'price_history_data'
+
+
 class PriceHistoryScraper:
     def __init__(self, headless=True):
         """Initialize the scraper with Chrome options"""
+        self.headless = headless
         self.setup_driver(headless)
         self.session = requests.Session()
         self.session.headers.update({
@@ -46,9 +244,29 @@ class PriceHistoryScraper:
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
         chrome_options.add_experimental_option('useAutomationExtension', False)
         
+        # Only the DOM and scripts matter for the chart data; skip images and notifications
+        # and return from driver.get() at DOMContentLoaded (waits below cover the chart)
+        chrome_options.page_load_strategy = 'eager'
+        # Performance logs expose Network.* events so chart API responses can be read back
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.default_content_setting_values.notifications": 2
+        })
+        
         try:
             self.driver = webdriver.Chrome(options=chrome_options)
             self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            
+            # Install the extractor on every new document so extraction only sends a short call
+            try:
+                self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": _CHART_FN_JS})
+                self._chart_script = _CHART_CALL_JS
+            except Exception as e:
+                logger.warning(f"Could not preinstall chart script, sending it with each call: {e}")
+                self._chart_script = _CHART_JS
         except Exception as e:
             logger.error(f"Failed to initialize Chrome driver: {e}")
             logger.info("Please ensure ChromeDriver is installed and in PATH")
@@ -59,6 +277,9 @@ class PriceHistoryScraper:
         logger.info(f"Loading URL: {url}")
         
         try:
+            # Drain performance events from earlier pages on this driver, so the network
+            # fallback only sees this page's responses
+            self.driver.get_log('performance')
             self.driver.get(url)
             
             # Wait for page to load
@@ -66,59 +287,20 @@ class PriceHistoryScraper:
                 EC.presence_of_element_located((By.TAG_NAME, "canvas"))
             )
             
-            # Wait a bit more for chart to render
-            time.sleep(5)
+            # Wait for a Chart.js instance with data to render, rather than a fixed delay
+            try:
+                WebDriverWait(self.driver, 10).until(lambda d: d.execute_script(_CHART_READY_JS))
+            except TimeoutException:
+                logger.info("Chart not ready after waiting, trying extraction anyway...")
             
             # Try multiple methods to extract chart data
             chart_data = None
             
             # Method 1: Extract from Chart.js instances
-            script = """
-            var chartData = null;
-            
-            // Try Chart.js instances
-            if (window.Chart && window.Chart.instances) {
-                var instances = Object.values(window.Chart.instances);
-                if (instances.length > 0) {
-                    var chart = instances[0];
-                    if (chart.data && chart.data.datasets) {
-                        chartData = {
-                            labels: chart.data.labels,
-                            data: chart.data.datasets[0].data
-                        };
-                    }
-                }
-            }
-            
-            // Try canvas chart property
-            if (!chartData) {
-                var canvas = document.querySelector('#price_history_chart') || 
-                           document.querySelector('canvas[class*="chart"]') ||
-                           document.querySelector('canvas');
-                if (canvas && canvas.chart) {
-                    chartData = {
-                        labels: canvas.chart.data.labels,
-                        data: canvas.chart.data.datasets[0].data
-                    };
-                }
-            }
-            
-            // Look for global variables
-            if (!chartData) {
-                var possibleVars = ['chartData', 'priceData', 'historyData', 'priceHistoryData'];
-                for (var i = 0; i < possibleVars.length; i++) {
-                    var varName = possibleVars[i];
-                    if (window[varName]) {
-                        chartData = window[varName];
-                        break;
-                    }
-                }
-            }
-            
-            return chartData;
-            """
-            
-            chart_data = self.driver.execute_script(script)
+            chart_data = self.driver.execute_script(self._chart_script)
+            if chart_data == _PHX_MISSING:
+                # The preinstalled extractor isn't on this document; send the full script
+                chart_data = self.driver.execute_script(_CHART_JS)
             
             if chart_data:
                 logger.info(f"Successfully extracted chart data with {len(chart_data.get('labels', []))} points")
@@ -139,21 +321,36 @@ class PriceHistoryScraper:
             logs = self.driver.get_log('performance')
             
             for log in logs:
-                message = json.loads(log['message'])
+                raw = log['message']
+                # Most CDP events are not responses; skip them before paying for a parse
+                if '"Network.responseReceived"' not in raw:
+                    continue
+                message = _json.loads(raw)
                 if message['message']['method'] == 'Network.responseReceived':
-                    url = message['message']['params']['response']['url']
+                    params = message['message']['params']
+                    url = params['response']['url']
                     
                     # Look for API endpoints that might contain price data
-                    if any(keyword in url.lower() for keyword in ['price', 'history', 'chart', 'data', 'api']):
+                    if _URL_KW.search(url):
                         logger.info(f"Found potential data URL: {url}")
                         
-                        # Try to fetch the data
+                        # Read the body Chrome already received instead of requesting it again
                         try:
-                            response = self.session.get(url)
-                            if response.status_code == 200:
-                                data = response.json()
-                                if self.validate_price_data(data):
-                                    return self.format_price_data(data)
+                            response = self.driver.execute_cdp_cmd(
+                                "Network.getResponseBody", {"requestId": params['requestId']}
+                            )
+                            body = response['body']
+                            if response.get('base64Encoded'):
+                                body = base64.b64decode(body)
+                            
+                            # Scripts, HTML and images often match the URL keywords; only parse
+                            # bodies that look like JSON (works for both str and bytes bodies)
+                            if body.lstrip()[:1] not in ('{', '[', b'{', b'['):
+                                continue
+                            
+                            data = _json.loads(body)
+                            if self.validate_price_data(data):
+                                return self.format_price_data(data)
                         except:
                             continue
             
@@ -170,7 +367,8 @@ class PriceHistoryScraper:
             response = self.session.get(url)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # Only script and meta tags are inspected, so don't build the rest of the tree
+            soup = BeautifulSoup(response.content, 'lxml', parse_only=_STRAINER)
             
             # Look for JSON data in script tags
             scripts = soup.find_all('script')
@@ -180,29 +378,21 @@ class PriceHistoryScraper:
                     content = script.string
                     
                     # Look for patterns that might contain price data
-                    patterns = [
-                        r'chartData\s*[:=]\s*(\{[^}]+\})',
-                        r'priceData\s*[:=]\s*(\[[^\]]+\])',
-                        r'historyData\s*[:=]\s*(\{[^}]+\})',
-                        r'labels\s*:\s*\[([^\]]+)\]',
-                        r'data\s*:\s*\[([^\]]+)\]'
-                    ]
-                    
-                    for pattern in patterns:
-                        matches = re.findall(pattern, content, re.IGNORECASE)
-                        if matches:
-                            logger.info(f"Found potential data pattern: {pattern}")
-                            try:
-                                # Try to parse as JSON
-                                for match in matches:
-                                    data = json.loads(match)
-                                    if self.validate_price_data(data):
-                                        return self.format_price_data(data)
-                            except:
-                                continue
+                    for pattern, matches in _find_chart_matches(content):
+                        logger.info(f"Found potential data pattern: {pattern.pattern}")
+                        try:
+                            # Try to parse as JSON
+                            for match in matches:
+                                if pattern in _BARE_ARRAY_PATTERNS:
+                                    match = f'[{match}]'
+                                data = _json.loads(match)
+                                if self.validate_price_data(data):
+                                    return self.format_price_data(data)
+                        except:
+                            continue
             
             # Look for meta tags or data attributes
-            meta_tags = soup.find_all('meta', {'name': re.compile(r'price|data', re.I)})
+            meta_tags = soup.find_all('meta', {'name': _META_PATTERN})
             for tag in meta_tags:
                 content = tag.get('content', '')
                 if content:
@@ -230,13 +420,8 @@ class PriceHistoryScraper:
         if isinstance(data, list) and len(data) > 0:
             first_item = data[0]
             if isinstance(first_item, dict):
-                price_keys = ['price', 'value', 'y', 'amount']
-                date_keys = ['date', 'time', 'x', 'timestamp']
-                
-                has_price = any(key in first_item for key in price_keys)
-                has_date = any(key in first_item for key in date_keys)
-                
-                return has_price and has_date
+                keys = first_item.keys()
+                return bool(_PRICE_KEYS & keys) and bool(_DATE_KEYS & keys)
         
         return False
     
@@ -252,6 +437,20 @@ class PriceHistoryScraper:
                 formatted_data['data'] = data['prices']
         
         elif isinstance(data, list):
+            # Detect the schema once from the first item and read those keys directly
+            date_key, price_key = _detect_keys(data[0]) if data and isinstance(data[0], dict) else (None, None)
+            if date_key and price_key:
+                try:
+                    labels = [item[date_key] for item in data]
+                    prices = [item[price_key] for item in data]
+                    if None not in labels and None not in prices:
+                        formatted_data['labels'] = labels
+                        formatted_data['data'] = prices
+                        return formatted_data
+                except (KeyError, TypeError):
+                    # Mixed-schema list, so match keys item by item below
+                    pass
+            
             for item in data:
                 if isinstance(item, dict):
                     # Try to extract date and price
@@ -259,9 +458,10 @@ class PriceHistoryScraper:
                     price_val = None
                     
                     for key, value in item.items():
-                        if key.lower() in ['date', 'time', 'x', 'timestamp']:
+                        key = key.lower()
+                        if key in _DATE_KEYS:
                             date_val = value
-                        elif key.lower() in ['price', 'value', 'y', 'amount']:
+                        elif key in _PRICE_KEYS:
                             price_val = value
                     
                     if date_val is not None and price_val is not None:
@@ -276,25 +476,20 @@ class PriceHistoryScraper:
         
         start_date = datetime(2022, 11, 1)
         end_date = datetime(2025, 8, 2)
-        
-        dates = []
-        prices = []
         base_price = 2999
         
-        current_date = start_date
-        while current_date <= end_date:
-            dates.append(current_date.strftime('%Y-%m-%d'))
-            
-            # Simulate price fluctuations
-            days_since_start = (current_date - start_date).days
-            seasonal_factor = 1 + 0.1 * (days_since_start % 365) / 365
-            trend_factor = 1 + 0.02 * days_since_start / 365
-            random_factor = 1 + (hash(str(current_date)) % 100 - 50) / 1000
-            
-            price = int(base_price * seasonal_factor * trend_factor * random_factor)
-            prices.append(price)
-            
-            current_date += timedelta(days=7)  # Weekly data points
+        # Weekly data points as day offsets from the start date
+        n_points = (end_date - start_date).days // 7 + 1
+        days_since_start = np.arange(n_points) * 7
+        
+        # Simulate price fluctuations
+        seasonal_factor = 1 + 0.1 * (days_since_start % 365) / 365
+        trend_factor = 1 + 0.02 * days_since_start / 365
+        rng = np.random.default_rng(0)
+        random_factor = 1 + (rng.integers(0, 100, n_points) - 50) / 1000
+        
+        prices = (base_price * seasonal_factor * trend_factor * random_factor).astype(np.int64).tolist()
+        dates = pd.date_range(start_date, periods=n_points, freq='7D').strftime('%Y-%m-%d').tolist()
         
         return {'labels': dates, 'data': prices}
     
@@ -305,12 +500,12 @@ class PriceHistoryScraper:
             return False
         
         try:
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['Date', 'Price'])
-                
-                for date, price in zip(data['labels'], data['data']):
-                    writer.writerow([date, price])
+            # zip() semantics: extra labels or prices beyond the shorter list are dropped
+            n_rows = min(len(data['labels']), len(data['data']))
+            pd.DataFrame({
+                'Date': data['labels'][:n_rows],
+                'Price': data['data'][:n_rows]
+            }).to_csv(filename, index=False, encoding='utf-8')
             
             logger.info(f"Data saved to {filename} with {len(data['labels'])} rows")
             return True
@@ -350,6 +545,54 @@ class PriceHistoryScraper:
         logger.error("All extraction methods failed")
         return None
     
+    def scrape_urls(self, urls, recycle_every=50, output_dir='.'):
+        """Scrape URLs one after another on this scraper's warm driver, yielding each result"""
+        for i, url in enumerate(urls, 1):
+            output_file = os.path.join(output_dir, f"{_slug(url)}.csv")
+            yield self.scrape_price_history(url, output_file)
+            
+            # Restart Chrome periodically to bound memory growth over long batches
+            if recycle_every and i % recycle_every == 0:
+                logger.info(f"Recycling Chrome driver after {i} pages")
+                self.driver.quit()
+                self.setup_driver(self.headless)
+    
+    @classmethod
+    def scrape_many(cls, urls, workers=8, headless=True, output_dir='.'):
+        """Scrape many URLs in parallel, keeping one warm scraper per worker thread"""
+        local = threading.local()
+        scrapers = []
+        scrapers_lock = threading.Lock()
+        
+        def init_worker():
+            # Each worker thread gets its own Chrome driver and requests.Session
+            local.scraper = cls(headless=headless)
+            with scrapers_lock:
+                scrapers.append(local.scraper)
+        
+        def scrape(url):
+            output_file = os.path.join(output_dir, f"{_slug(url)}.csv")
+            return local.scraper.scrape_price_history(url, output_file)
+        
+        results = {}
+        try:
+            with ThreadPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+                future_to_url = {executor.submit(scrape, url): url for url in urls}
+                
+                for future in as_completed(future_to_url):
+                    url = future_to_url[future]
+                    try:
+                        results[url] = future.result()
+                        logger.info(f"Finished {url} ({len(results)}/{len(urls)})")
+                    except Exception as e:
+                        results[url] = None
+                        logger.error(f"Scraping {url} failed: {e}")
+        finally:
+            for scraper in scrapers:
+                scraper.close()
+        
+        return results
+    
     def close(self):
         """Clean up resources"""
         if hasattr(self, 'driver'):
@@ -0,0 +1,264 @@
+"""
+Unit tests for the PriceBefore async scraper helpers.
+"""
+
+import asyncio
+import csv
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import numpy as np
+import pytest
+
+from src.price_before import EnhancedPriceHistoryScraper, _RateLimitedTransport, fetch, to_price_arrays
+
+
+class CountingLimiter:
+    """Stand-in for AsyncLimiter that counts the tokens taken"""
+
+    def __init__(self):
+        self.acquired = 0
+
+    async def __aenter__(self):
+        self.acquired += 1
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    """Serves /ok with 200, /missing with 404 and /flaky with 503, counting hits per path"""
+
+    statuses = {'/ok': 200, '/missing': 404, '/flaky': 503}
+
+    def do_GET(self):
+        self.server.hits[self.path] += 1
+        body = f'{self.path} hit {self.server.hits[self.path]}'.encode()
+        self.send_response(self.statuses.get(self.path, 404))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def page_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _PageHandler)
+    server.hits = Counter()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def mock_client(statuses, limiter):
+    """Client whose network transport answers with statuses in order, behind the rate limiter"""
+    responses = iter(statuses)
+    transport = httpx.MockTransport(lambda request: httpx.Response(next(responses), text='body'))
+    return httpx.AsyncClient(transport=_RateLimitedTransport(transport, limiter))
+
+
+def test_extract_price_from_html_skips_non_numeric_arrays():
+    """Candidates that parse as JSON but aren't price lists are skipped, not raised"""
+    script = (
+        'var chartData = {"labels": ["a", "b"], "data": [{"x": 1}, "y"]}; '
+        'priceData = [{"nested": {"price": "n/a"}}, "text"]'
+    )
+    scraper = EnhancedPriceHistoryScraper()
+
+    price_arrays = scraper.extract_price_from_html(f'<html><script>{script}</script></html>')
+
+    assert len(price_arrays['dates']) == 0
+    assert len(price_arrays['prices']) == 0
+
+
+def test_to_price_arrays_drops_non_numeric_prices():
+    dates = np.datetime64('2022-11-01') + np.arange(12) * 7
+    prices = [{'price': 100}, 'n/a', [1, 2]] * 4
+
+    price_arrays = to_price_arrays(dates, prices)
+
+    assert len(price_arrays['prices']) == 0
+
+
+def baseline_csv_rows(title, brand, labels, prices):
+    """Rows the pre-NumPy save_to_csv wrote: labels and prices passed through unchanged"""
+    rows = [['title', 'brand', 'date', 'price']]
+    rows += [[title, brand, str(label), str(price)] for label, price in zip(labels, prices)]
+    return rows
+
+
+def test_save_to_csv_matches_baseline_rows(tmp_path):
+    """ISO labels with integer prices round-trip to the same rows as the baseline writer"""
+    labels = ['2022-11-01', '2022-11-02', '2022-11-03']
+    prices = [41310, 42311, 45473]
+    product = {'title': 'Lenovo V15', 'brand': 'LENOVO', **to_price_arrays(labels, prices)}
+
+    path = EnhancedPriceHistoryScraper().save_to_csv([product], str(tmp_path / 'out.csv'))
+
+    with open(path, newline='', encoding='utf-8') as f:
+        assert list(csv.reader(f)) == baseline_csv_rows('Lenovo V15', 'LENOVO', labels, prices)
+
+
+def test_to_price_arrays_mixed_date_formats():
+    price_arrays = to_price_arrays(['07 Nov 2022', '2022-11-08', "Dec '22", ' 09 Nov 2022 '], [1, 2, 3, 4])
+
+    assert price_arrays['dates'].tolist() == [
+        np.datetime64('2022-11-07'), np.datetime64('2022-11-08'),
+        np.datetime64('2022-12-01'), np.datetime64('2022-11-09')
+    ]
+    assert price_arrays['prices'].tolist() == [1, 2, 3, 4]
+
+
+def test_to_price_arrays_epoch_milliseconds():
+    price_arrays = to_price_arrays([1667260800000, 1667347200000.0], [100, 200])
+
+    assert price_arrays['dates'].tolist() == [np.datetime64('2022-11-01'), np.datetime64('2022-11-02')]
+
+
+def test_to_price_arrays_drops_yearless_labels_and_logs(caplog):
+    with caplog.at_level(logging.WARNING):
+        price_arrays = to_price_arrays(['01 Nov', '2022-11-02', 'soon'], [100, 200, 300])
+
+    assert price_arrays['dates'].tolist() == [np.datetime64('2022-11-02')]
+    assert price_arrays['prices'].tolist() == [200]
+    assert 'Dropped 2 of 3 price points' in caplog.text
+
+
+def test_to_price_arrays_int32_range():
+    labels = ['2022-11-01', '2022-11-02', '2022-11-03', '2022-11-04']
+    price_arrays = to_price_arrays(labels, [3_000_000_000, -3_000_000_000, 2_147_483_647, 999])
+
+    assert price_arrays['prices'].dtype == np.int32
+    assert price_arrays['prices'].tolist() == [2_147_483_647, 999]
+
+
+def test_to_price_arrays_rounds_float_prices():
+    price_arrays = to_price_arrays(['2022-11-01', '2022-11-02', '2022-11-03'], [1999.6, '1499.4', 10.0])
+
+    assert price_arrays['prices'].tolist() == [2000, 1499, 10]
+
+
+def test_to_price_arrays_trims_to_shorter_sequence():
+    """Like the baseline, extra labels or prices without a partner are ignored"""
+    price_arrays = to_price_arrays(['2022-11-01', '2022-11-02', '2022-11-03'], [5, 6])
+
+    assert len(price_arrays['dates']) == len(price_arrays['prices']) == 2
+
+
+def test_to_price_arrays_empty():
+    price_arrays = to_price_arrays()
+
+    assert price_arrays['dates'].dtype == np.dtype('datetime64[D]')
+    assert len(price_arrays['prices']) == 0
+
+
+def test_fetch_retries_5xx_taking_a_token_per_attempt():
+    limiter = CountingLimiter()
+
+    async def run():
+        async with mock_client([503, 502, 200], limiter) as client:
+            return await fetch(client, 'https://www.pricebefore.com/p1.html', backoff_factor=0)
+
+    assert asyncio.run(run()) == ('https://www.pricebefore.com/p1.html', 200, 'body')
+    assert limiter.acquired == 3
+
+
+def test_fetch_returns_last_status_when_retries_run_out():
+    limiter = CountingLimiter()
+
+    async def run():
+        async with mock_client([503] * 4, limiter) as client:
+            return await fetch(client, 'https://www.pricebefore.com/p1.html', retries=3, backoff_factor=0)
+
+    assert asyncio.run(run())[1] == 503
+    assert limiter.acquired == 4
+
+
+def test_fetch_does_not_retry_client_errors():
+    limiter = CountingLimiter()
+
+    async def run():
+        async with mock_client([404, 200], limiter) as client:
+            return await fetch(client, 'https://www.pricebefore.com/p1.html', backoff_factor=0)
+
+    assert asyncio.run(run())[1] == 404
+    assert limiter.acquired == 1
+
+
+def test_fetch_transport_errors_return_none():
+    def fail(request):
+        raise httpx.ConnectError('refused', request=request)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(fail)) as client:
+            return await fetch(client, 'https://www.pricebefore.com/p1.html', retries=1, backoff_factor=0)
+
+    assert asyncio.run(run()) == ('https://www.pricebefore.com/p1.html', None, None)
+
+
+def test_cached_responses_take_no_rate_limit_token(page_server, tmp_path):
+    scraper = EnhancedPriceHistoryScraper(cache_dir=str(tmp_path))
+    limiter = CountingLimiter()
+
+    async def run():
+        async with scraper.create_client(httpx.Limits(), limiter) as client:
+            for _ in range(3):
+                await fetch(client, f'{page_server.url}/ok')
+
+    asyncio.run(run())
+
+    assert page_server.hits['/ok'] == 1
+    assert limiter.acquired == 1
+
+
+def fetch_with_new_client(scraper, urls):
+    """Fetch urls in order with a fresh client, as one scrape run would"""
+    async def run():
+        async with scraper.create_client(httpx.Limits()) as client:
+            return [await fetch(client, url, backoff_factor=0) for url in urls]
+
+    return asyncio.run(run())
+
+
+def test_second_run_is_served_from_cache(page_server, tmp_path):
+    scraper = EnhancedPriceHistoryScraper(cache_dir=str(tmp_path))
+    url = f'{page_server.url}/ok'
+
+    first = fetch_with_new_client(scraper, [url])
+    second = fetch_with_new_client(scraper, [url])
+
+    assert page_server.hits['/ok'] == 1
+    assert second == first == [(url, 200, '/ok hit 1')]
+    assert (tmp_path / 'cache.db').exists()
+
+
+def test_non_200_responses_are_not_cached(page_server, tmp_path):
+    scraper = EnhancedPriceHistoryScraper(cache_dir=str(tmp_path))
+    urls = [f'{page_server.url}/missing', f'{page_server.url}/flaky']
+
+    fetch_with_new_client(scraper, urls)
+    second = fetch_with_new_client(scraper, urls)
+
+    assert page_server.hits['/missing'] == 2
+    # fetch retries the 503 three times per run
+    assert page_server.hits['/flaky'] == 8
+    assert [status for _, status, _ in second] == [404, 503]
+
+
+def test_cache_disabled_always_hits_network(page_server, tmp_path):
+    scraper = EnhancedPriceHistoryScraper(use_cache=False, cache_dir=str(tmp_path))
+    url = f'{page_server.url}/ok'
+
+    fetch_with_new_client(scraper, [url])
+    fetch_with_new_client(scraper, [url])
+
+    assert page_server.hits['/ok'] == 2
+    assert not (tmp_path / 'cache.db').exists()
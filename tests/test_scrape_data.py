@@ -0,0 +1,264 @@
+"""
+Unit tests for the page source chart extraction helpers.
+"""
+
+import importlib.util
+import os
+import random
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import src.scrape_data as scrape_data
+from src.scrape_data import (
+    PriceHistoryScraper, _CHART_CALL_JS, _CHART_JS, _CHART_PATTERNS, _CHART_READY_JS, _PHX_MISSING,
+    _find_chart_matches
+)
+
+
+NESTED_SCRIPT = (
+    'var chartData = {labels: ["Nov 2022", "Dec 2022"], '
+    'data: [{"date": "2022-11-01", "price": 1999}, {"date": "2022-12-01", "price": 1899}]};'
+)
+
+
+def page_source_scraper(html):
+    """Build a scraper whose session serves html, without starting Chrome"""
+    scraper = PriceHistoryScraper.__new__(PriceHistoryScraper)
+    scraper.session = Mock()
+    scraper.session.get.return_value = Mock(content=html.encode('utf-8'))
+    return scraper
+
+
+def test_find_chart_matches_keeps_nested_matches():
+    """Matches inside a chartData blob are reported the same as separate findall calls"""
+    expected = [
+        (pattern, pattern.findall(NESTED_SCRIPT))
+        for pattern in _CHART_PATTERNS
+        if pattern.findall(NESTED_SCRIPT)
+    ]
+    matches = _find_chart_matches(NESTED_SCRIPT)
+
+    assert matches == expected
+    assert [pattern.pattern for pattern, _ in matches] == [
+        _CHART_PATTERNS[0].pattern, _CHART_PATTERNS[3].pattern, _CHART_PATTERNS[4].pattern
+    ]
+
+
+def test_find_chart_matches_without_keywords():
+    assert _find_chart_matches('var total = 42; console.log(total);') == []
+
+
+def test_page_source_parses_bare_list_of_dicts():
+    """A data: capture of {...},{...} is wrapped in brackets and parsed as price points"""
+    scraper = page_source_scraper(f'<html><body><script>{NESTED_SCRIPT}</script></body></html>')
+
+    assert scraper.extract_from_page_source('https://www.pricebefore.com/p1.html') == {
+        'labels': ['2022-11-01', '2022-12-01'],
+        'data': [1999, 1899]
+    }
+
+
+def test_page_source_parses_price_data_array():
+    script = 'priceData = [{"x": "2023-01-01", "y": 500}, {"x": "2023-02-01", "y": 450}]'
+    scraper = page_source_scraper(f'<html><head><script>{script}</script></head></html>')
+
+    assert scraper.extract_from_page_source('https://www.pricebefore.com/p2.html') == {
+        'labels': ['2023-01-01', '2023-02-01'],
+        'data': [500, 450]
+    }
+
+
+def test_page_source_without_chart_data():
+    scraper = page_source_scraper('<html><body><script>var x = 1;</script></body></html>')
+
+    assert scraper.extract_from_page_source('https://www.pricebefore.com/p3.html') is None
+
+
+def random_scripts(count, seed=0):
+    """Script fragments mixing chart keywords, brackets and separators"""
+    tokens = ['chartData = ', 'priceData=', 'historyData :', 'labels: ', 'data:', 'DATA : ',
+              '{', '}', '[', ']', '1,', '"a"', ' ', 'x', '\n']
+    rng = random.Random(seed)
+    return [''.join(rng.choice(tokens) for _ in range(rng.randint(0, 30))) for _ in range(count)]
+
+
+def test_hyperscan_matches_re_fallback(monkeypatch):
+    pytest.importorskip('hyperscan')
+    assert scrape_data._CHART_DATABASE is not None
+
+    scripts = [NESTED_SCRIPT, 'var total = 42;'] + random_scripts(500)
+    hyperscan_matches = [_find_chart_matches(script) for script in scripts]
+    monkeypatch.setattr(scrape_data, '_CHART_DATABASE', None)
+
+    assert hyperscan_matches == [_find_chart_matches(script) for script in scripts]
+
+
+def test_hyperscan_compile_error_falls_back_to_re(monkeypatch):
+    hyperscan = pytest.importorskip('hyperscan')
+
+    class FailingDatabase:
+        def compile(self, **kwargs):
+            raise hyperscan.error('unsupported')
+
+    monkeypatch.setattr(hyperscan, 'Database', FailingDatabase)
+    spec = importlib.util.spec_from_file_location('scrape_data_copy', scrape_data.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    assert module._CHART_DATABASE is None
+    assert module._find_chart_matches('x = {data: [1,2]}') == [(module._CHART_PATTERNS[4], ['1,2'])]
+
+
+class FakeChrome:
+    """Stand-in for webdriver.Chrome that records calls instead of driving a browser"""
+
+    def __init__(self, options=None):
+        self.options = options
+        self.created_on = threading.get_ident()
+        self.script_results = {_CHART_READY_JS: True}
+        self.scripts = []
+        self.visited = []
+        self.quit_called = False
+
+    def execute_script(self, script, *args):
+        self.scripts.append(script)
+        return self.script_results.get(script)
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {}
+
+    def get_log(self, log_type):
+        return []
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def find_element(self, by, value):
+        return object()
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def fake_chrome(monkeypatch):
+    """Patch webdriver.Chrome with FakeChrome, returning the list of drivers created"""
+    drivers = []
+    lock = threading.Lock()
+
+    def create(options=None):
+        driver = FakeChrome(options)
+        with lock:
+            drivers.append(driver)
+        return driver
+
+    monkeypatch.setattr(scrape_data.webdriver, 'Chrome', create)
+    return drivers
+
+
+def test_chart_extraction_uses_preinstalled_extractor(fake_chrome):
+    scraper = PriceHistoryScraper()
+    driver = fake_chrome[0]
+    driver.script_results[_CHART_CALL_JS] = {'labels': ['2023-01-01'], 'data': [500]}
+
+    assert scraper.extract_chart_data_selenium('https://www.pricebefore.com/p1.html') == {
+        'labels': ['2023-01-01'], 'data': [500]
+    }
+    assert _CHART_JS not in driver.scripts
+
+
+def test_chart_extraction_sends_full_script_when_extractor_missing(fake_chrome):
+    """A document without window.__phx falls back to the full extraction script"""
+    scraper = PriceHistoryScraper()
+    driver = fake_chrome[0]
+    driver.script_results[_CHART_CALL_JS] = _PHX_MISSING
+    driver.script_results[_CHART_JS] = {'labels': ['2023-01-01'], 'data': [500]}
+
+    assert scraper.extract_chart_data_selenium('https://www.pricebefore.com/p1.html') == {
+        'labels': ['2023-01-01'], 'data': [500]
+    }
+    assert driver.scripts.index(_CHART_CALL_JS) < driver.scripts.index(_CHART_JS)
+
+
+@pytest.fixture
+def fake_scrape(monkeypatch):
+    """Replace scrape_price_history with a recorder that fails for URLs containing 'bad'"""
+    calls = []
+    lock = threading.Lock()
+
+    def scrape_price_history(self, url, output_file='price_history_data.csv'):
+        with lock:
+            calls.append({'thread': threading.get_ident(), 'scraper': self, 'driver': self.driver,
+                          'url': url, 'output_file': output_file})
+        # Give the other worker threads a chance to pick up work
+        time.sleep(0.01)
+        if 'bad' in url:
+            raise RuntimeError('chart failed to load')
+        return {'labels': [url], 'data': [1]}
+
+    monkeypatch.setattr(PriceHistoryScraper, 'scrape_price_history', scrape_price_history)
+    return calls
+
+
+def product_urls(count):
+    return [f'https://www.pricebefore.com/phone-{i}-p{i}.html' for i in range(count)]
+
+
+def test_scrape_many_uses_one_scraper_per_worker_thread(fake_chrome, fake_scrape):
+    urls = product_urls(12)
+
+    results = PriceHistoryScraper.scrape_many(urls, workers=3, output_dir='out')
+
+    assert results == {url: {'labels': [url], 'data': [1]} for url in urls}
+    scrapers_by_thread = {}
+    for call in fake_scrape:
+        scrapers_by_thread.setdefault(call['thread'], set()).add(call['scraper'])
+    assert all(len(scrapers) == 1 for scrapers in scrapers_by_thread.values())
+    assert 1 < len(scrapers_by_thread) <= 3
+    # Each scraper's driver was created on the worker thread that uses it
+    assert all(call['driver'].created_on == call['thread'] for call in fake_scrape)
+    assert len(fake_chrome) <= 3
+    assert sorted(call['output_file'] for call in fake_scrape) == sorted(
+        os.path.join('out', f'phone-{i}-p{i}.csv') for i in range(12)
+    )
+
+
+def test_scrape_many_closes_scrapers_and_isolates_errors(fake_chrome, fake_scrape):
+    urls = product_urls(3) + ['https://www.pricebefore.com/bad-p99.html'] + product_urls(6)[3:]
+
+    results = PriceHistoryScraper.scrape_many(urls, workers=2)
+
+    assert results.pop('https://www.pricebefore.com/bad-p99.html') is None
+    assert all(result is not None for result in results.values())
+    assert len(results) == 6
+    assert fake_chrome and all(driver.quit_called for driver in fake_chrome)
+
+
+def test_scrape_urls_recycles_driver_every_n_urls(fake_chrome, fake_scrape):
+    scraper = PriceHistoryScraper(headless=False)
+    urls = product_urls(5)
+
+    results = list(scraper.scrape_urls(urls, recycle_every=2, output_dir='out'))
+
+    assert results == [{'labels': [url], 'data': [1]} for url in urls]
+    assert len(fake_chrome) == 3
+    assert [call['driver'] for call in fake_scrape] == [
+        fake_chrome[0], fake_chrome[0], fake_chrome[1], fake_chrome[1], fake_chrome[2]
+    ]
+    assert [driver.quit_called for driver in fake_chrome] == [True, True, False]
+    # Recycled drivers keep the scraper's headless setting
+    assert all('--headless' not in driver.options.arguments for driver in fake_chrome)
+    assert fake_scrape[0]['output_file'] == os.path.join('out', 'phone-0-p0.csv')
+
+
+def test_scrape_urls_without_recycling(fake_chrome, fake_scrape):
+    scraper = PriceHistoryScraper()
+
+    list(scraper.scrape_urls(product_urls(4), recycle_every=0))
+
+    assert len(fake_chrome) == 1
+    assert not fake_chrome[0].quit_called
+    assert '--headless' in fake_chrome[0].options.arguments